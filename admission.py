@@ -0,0 +1,154 @@
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available (0 if one is available now); takes nothing"""
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else math.inf
+
+    def take(self):
+        """Take one token; only call after wait_time() returned 0"""
+        self.tokens -= 1
+
+    def is_full(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class AdmissionController:
+    """
+    In-process admission control for verifications.
+    Per-tg_id and per-IP token buckets reject abusive clients early, and a global
+    concurrency limit with a short bounded wait queue sheds load fast when the
+    workers are saturated. Every rejection is counted by reason.
+    At most max_tracked_keys buckets are kept (least recently used are evicted),
+    and idle, refilled buckets are pruned every prune_interval seconds.
+    """
+
+    def __init__(self, tg_rate: float, tg_burst: float, ip_rate: float, ip_burst: float,
+                 max_concurrent: int, max_queue: int, queue_wait: float, max_tracked_keys: int = 10000,
+                 prune_interval: float = 60):
+        self.tg_rate = tg_rate
+        self.tg_burst = tg_burst
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_wait = queue_wait
+        self.max_tracked_keys = max_tracked_keys
+        self.prune_interval = prune_interval
+        self.next_prune = time.monotonic() + prune_interval
+        self.buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.waiting = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejections = Counter()
+        self.lock = threading.Lock()
+
+    def check_rate(self, tg_id, client_ip: Optional[str]) -> Optional[float]:
+        """
+        Charge one request to the caller's tg_id and IP buckets.
+        Returns None if allowed, otherwise the Retry-After delay in seconds.
+        """
+        with self.lock:
+            if time.monotonic() >= self.next_prune:
+                self._prune()
+            buckets = [(self._bucket(("tg_id", str(tg_id)), self.tg_rate, self.tg_burst), "tg_id_rate")]
+            if client_ip:
+                buckets.append((self._bucket(("ip", client_ip), self.ip_rate, self.ip_burst), "ip_rate"))
+            # Check every bucket before taking from any, so a rejection costs the caller nothing
+            for bucket, reason in buckets:
+                retry_after = bucket.wait_time()
+                if retry_after > 0:
+                    self.rejections[reason] += 1
+                    return retry_after
+            for bucket, _ in buckets:
+                bucket.take()
+        return None
+
+    def reject(self, reason: str):
+        """Count a rejection made outside the controller (e.g. a full job queue)"""
+        with self.lock:
+            self.rejections[reason] += 1
+
+    def acquire_slot(self, blocking: bool = False) -> bool:
+        """
+        Wait briefly for a verification slot; False if the queue is full or the wait times out.
+        With blocking=True (background jobs) wait as long as it takes instead.
+        """
+        if blocking:
+            self.slots.acquire()
+            with self.lock:
+                self.in_flight += 1
+                self.admitted += 1
+            return True
+        with self.lock:
+            if self.waiting >= self.max_queue:
+                self.rejections["queue_full"] += 1
+                return False
+            self.waiting += 1
+        acquired = self.slots.acquire(timeout=self.queue_wait)
+        with self.lock:
+            self.waiting -= 1
+            if acquired:
+                self.in_flight += 1
+                self.admitted += 1
+            else:
+                self.rejections["concurrency"] += 1
+        return acquired
+
+    def release_slot(self):
+        with self.lock:
+            self.in_flight -= 1
+        self.slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for observability"""
+        with self.lock:
+            return {
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "tracked_clients": len(self.buckets),
+                "rejections": dict(self.rejections),
+                "rejections_total": sum(self.rejections.values()),
+            }
+
+    def _bucket(self, key: Hashable, rate: float, burst: float) -> TokenBucket:
+        """Get or create a bucket, evicting the least recently used one past the cap (caller holds the lock)"""
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(rate, burst)
+            while len(self.buckets) > self.max_tracked_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        return bucket
+
+    def _prune(self):
+        """Forget idle clients whose buckets have refilled (caller holds the lock)"""
+        for key in [key for key, bucket in self.buckets.items() if bucket.is_full()]:
+            del self.buckets[key]
+        self.next_prune = time.monotonic() + self.prune_interval
@@ -1,11 +1,20 @@
-from flask import Flask, request, jsonify, send_from_directory
-from flask_cors import CORS
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
+from werkzeug.middleware.proxy_fix import ProxyFix
 import requests
 import os
 from dotenv import load_dotenv
-from verifier_python import has_nft  # Changed to use Python-based verifier
+from verifier_python import check_collections, normalize_collection_ids, COLLECTION_RULES  # Changed to use Python-based verifier
+from verification_jobs import VerificationJobs
+from deadline import Deadline, DeadlineExceeded
+from reverification import ReverificationScheduler
+from admission import AdmissionController
+import atexit
+import hmac
+import json
+import math
 import time
 import logging
+from typing import Optional
 
 load_dotenv()
 
@@ -14,6 +23,9 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+# Render's proxy appends the real client address as the last X-Forwarded-For hop;
+# trust only that one so clients can't pick the IP they are rate limited as
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1)
 
 # Configure CORS to allow specific origins
 allowed_origins = [
@@ -24,116 +36,313 @@ allowed_origins = [
     "http://127.0.0.1:3001"
 ]
 
-CORS(app, 
-     origins=allowed_origins,
-     methods=["GET", "POST", "OPTIONS"],
-     allow_headers=["Content-Type", "Authorization", "X-Requested-With"],
-     supports_credentials=True,
-     max_age=3600)
+# CORS headers are computed once at startup and applied by the middleware below.
+# Allowed origins are echoed back with credentials; any other origin gets "*"
+# (browsers reject "*" combined with credentials, so none is sent there).
+_BASE_CORS_HEADERS = {
+    'Access-Control-Allow-Headers': 'Content-Type,Authorization,X-Requested-With',
+    'Access-Control-Allow-Methods': 'GET,POST,OPTIONS',
+    'Access-Control-Max-Age': '3600',
+    'Vary': 'Origin'
+}
+WILDCARD_CORS_HEADERS = {**_BASE_CORS_HEADERS, 'Access-Control-Allow-Origin': '*'}
+ORIGIN_CORS_HEADERS = {
+    origin: {**_BASE_CORS_HEADERS, 'Access-Control-Allow-Origin': origin, 'Access-Control-Allow-Credentials': 'true'}
+    for origin in allowed_origins
+}
+
+@app.before_request
+def answer_preflight():
+    """Answer every OPTIONS preflight with a static, empty 204"""
+    if request.method == 'OPTIONS':
+        return app.response_class(status=204)
+
+@app.after_request
+def apply_cors_headers(response):
+    """Apply the precomputed CORS header set exactly once per response"""
+    response.headers.update(ORIGIN_CORS_HEADERS.get(request.headers.get('Origin'), WILDCARD_CORS_HEADERS))
+    return response
+
+API_VERSION = "2.0.0"
+
+# Config and health payloads are serialized once at startup; they are hit by
+# Render's health checks far more often than anything else
+CONFIG_PAYLOAD = json.dumps({
+    "helius_api_key": os.getenv("HELIUS_API_KEY", ""),
+    "status": "operational",
+    "version": API_VERSION
+}).encode()
+# The health timestamp is appended per request to the pre-serialized prefix
+HEALTH_PAYLOAD_PREFIX = json.dumps({"status": "healthy", "version": API_VERSION})[:-1] + ', "timestamp": '
 
 # UPDATE THIS URL to your bot server webhook
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "https://bot-server-kem4.onrender.com/verify_callback")
 
 # Performance settings
-WEBHOOK_TIMEOUT = 10  # 10 seconds timeout for webhook calls
-MAX_VERIFICATION_TIME = 25  # Maximum time for verification process
+WEBHOOK_TIMEOUT = 10  # Cap for webhook calls; never more than the remaining deadline
+MAX_VERIFICATION_TIME = float(os.getenv("MAX_VERIFICATION_TIME", "25"))  # End-to-end budget per verification
+
+# Async verification job settings
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))  # Bounded worker pool size
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "100"))  # Max queued/running jobs
+JOB_TTL = 300  # Keep finished job results for 5 minutes
+JOB_MAX_WAIT = 25  # Maximum long-poll wait in seconds
+JOB_SSE_TIMEOUT = 60  # Maximum lifetime of an SSE stream in seconds
+SSE_KEEPALIVE_INTERVAL = 15  # Seconds between SSE keepalive comments
+
+verification_jobs = VerificationJobs(max_workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING, job_ttl=JOB_TTL)
+
+# Scheduled re-verification settings
+REVERIFY_ENABLED = os.getenv("REVERIFY_ENABLED", "false").lower() == "true"
+REVERIFY_STORE_PATH = os.getenv("REVERIFY_STORE_PATH", "reverify_store.json")  # Known (tg_id, wallet, collection) tuples
+REVERIFY_INTERVAL = float(os.getenv("REVERIFY_INTERVAL", "21600"))  # Re-check each wallet every 6 hours
+REVERIFY_SWEEP_INTERVAL = float(os.getenv("REVERIFY_SWEEP_INTERVAL", "60"))  # Seconds between sweeps
+REVERIFY_MAX_PER_SWEEP = int(os.getenv("REVERIFY_MAX_PER_SWEEP", "50"))  # Wallets checked per sweep
+REVERIFY_RATE = float(os.getenv("REVERIFY_RATE", "1"))  # Upstream checks per second during a sweep
+REVERIFY_MAX_ENTRIES = int(os.getenv("REVERIFY_MAX_ENTRIES", "10000"))  # Keep below MAX_PER_SWEEP * INTERVAL / SWEEP_INTERVAL
+REVERIFY_ENTRY_TTL = float(os.getenv("REVERIFY_ENTRY_TTL", "2592000"))  # Forget members not seen live for 30 days
+
+# Admission control settings
+RATE_LIMIT_TG_PER_MINUTE = float(os.getenv("RATE_LIMIT_TG_PER_MINUTE", "6"))  # Sustained verifications per tg_id
+RATE_LIMIT_TG_BURST = float(os.getenv("RATE_LIMIT_TG_BURST", "3"))
+RATE_LIMIT_IP_PER_MINUTE = float(os.getenv("RATE_LIMIT_IP_PER_MINUTE", "30"))  # Sustained verifications per client IP
+RATE_LIMIT_IP_BURST = float(os.getenv("RATE_LIMIT_IP_BURST", "10"))
+# The bot server posts for every member from one IP; exempt it from the per-IP limit
+RATE_LIMIT_EXEMPT_IPS = {ip.strip() for ip in os.getenv("RATE_LIMIT_EXEMPT_IPS", "").split(",") if ip.strip()}
+BOT_API_SECRET = os.getenv("BOT_API_SECRET", "")  # Shared secret sent by the bot in X-Bot-Secret
+MAX_CONCURRENT_VERIFICATIONS = int(os.getenv("MAX_CONCURRENT_VERIFICATIONS", "8"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "16"))  # Requests allowed to wait for a slot
+ADMISSION_QUEUE_WAIT = 2  # Seconds a request may wait for a slot before 429
+JOB_QUEUE_RETRY_AFTER = 5  # Retry-After when the async job queue is full
+
+admission = AdmissionController(
+    tg_rate=RATE_LIMIT_TG_PER_MINUTE / 60, tg_burst=RATE_LIMIT_TG_BURST,
+    ip_rate=RATE_LIMIT_IP_PER_MINUTE / 60, ip_burst=RATE_LIMIT_IP_BURST,
+    max_concurrent=MAX_CONCURRENT_VERIFICATIONS, max_queue=ADMISSION_QUEUE_SIZE,
+    queue_wait=ADMISSION_QUEUE_WAIT
+)
+
+def get_client_ip() -> str:
+    """Client IP as seen by Render's proxy (ProxyFix trusts only the hop it appended)"""
+    return request.remote_addr
+
+def is_trusted_caller() -> bool:
+    """True for the bot server: a matching X-Bot-Secret header or an allowlisted IP"""
+    if BOT_API_SECRET and hmac.compare_digest(request.headers.get('X-Bot-Secret', ''), BOT_API_SECRET):
+        return True
+    return get_client_ip() in RATE_LIMIT_EXEMPT_IPS
+
+def is_valid_collection_ids(value) -> bool:
+    """Accept None, a collection id string, or a list of non-empty collection id strings"""
+    if value is None or isinstance(value, str):
+        return True
+    return isinstance(value, list) and all(isinstance(item, str) and item for item in value)
+
+def too_many_requests(message: str, retry_after: float):
+    """Fast 429 response with a Retry-After header"""
+    response = jsonify({"error": message, "has_nft": False, "status": "rejected"})
+    response.headers['Retry-After'] = str(max(math.ceil(retry_after), 1))
+    return response, 429
 
 @app.route('/api/config')
 def get_config():
     """Return configuration data including API keys"""
-    response = jsonify({
-        "helius_api_key": os.getenv("HELIUS_API_KEY", ""),
-        "status": "operational",
-        "version": "2.0.0"
-    })
+    return app.response_class(CONFIG_PAYLOAD, mimetype='application/json')
+
+def send_webhook(webhook_data: dict, deadline: Deadline) -> Optional[bool]:
+    """
+    Send a verification result to the bot server within the remaining deadline.
+    Returns True if delivered, False if not, and None if the deadline hit while the
+    POST was in flight: the bot may or may not have received it.
+    """
+    tg_id = webhook_data.get("tg_id")
+    try:
+        timeout = deadline.timeout(WEBHOOK_TIMEOUT)
+    except DeadlineExceeded as e:
+        logger.warning(f"⏱️ Skipping webhook for user {tg_id}: {e}")
+        return False
+    session = requests.Session()
+    try:
+        # deadline.call bounds the wall-clock wait, not just each socket phase; the
+        # abandoned POST itself ends at its socket timeout, which is within the budget
+        webhook_response = deadline.call(session.post, WEBHOOK_URL, json=webhook_data, timeout=timeout,
+                                         cancel=session.close)
+        if webhook_response.status_code == 200:
+            logger.info(f"✅ Webhook sent successfully for user {tg_id}")
+            return True
+        logger.warning(f"❌ Webhook failed for user {tg_id}: {webhook_response.status_code}")
+        logger.warning(f"📄 Webhook response: {webhook_response.text}")
+    except DeadlineExceeded as e:
+        logger.warning(f"⏱️ Webhook delivery unknown for user {tg_id}: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"❌ Error sending webhook: {e}")
+        # Don't fail the verification if webhook fails
+    finally:
+        session.close()
+    return False
+
+def check_collections_admitted(*args):
+    """Re-verification check under the same global concurrency limit as live verifications"""
+    admission.acquire_slot(blocking=True)
+    try:
+        return check_collections(*args)
+    finally:
+        admission.release_slot()
+
+reverification_scheduler = ReverificationScheduler(
+    REVERIFY_STORE_PATH, check_collections_admitted, send_webhook,
+    interval=REVERIFY_INTERVAL, sweep_interval=REVERIFY_SWEEP_INTERVAL,
+    max_per_sweep=REVERIFY_MAX_PER_SWEEP, rate_per_second=REVERIFY_RATE,
+    verification_budget=MAX_VERIFICATION_TIME,
+    max_entries=REVERIFY_MAX_ENTRIES, entry_ttl=REVERIFY_ENTRY_TTL
+) if REVERIFY_ENABLED else None
+
+def run_verification(wallet_address: str, tg_id, collection_ids: list, rule: str, min_count: int,
+                     deadline: Deadline = None) -> dict:
+    """
+    Check NFT ownership, notify the bot server and build the response payload.
+    Every step shares one deadline budget (MAX_VERIFICATION_TIME unless given).
+    """
+    start_time = time.time()
+    if deadline is None:
+        deadline = Deadline(MAX_VERIFICATION_TIME)
     
-    # Add CORS headers for all origins
-    response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Requested-With')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
-    response.headers.add('Access-Control-Allow-Credentials', 'true')
-    response.headers.add('Access-Control-Max-Age', '3600')
+    # Verify NFT ownership for all collections from a single fetch
+    result = check_collections(wallet_address, collection_ids, rule, min_count, deadline)
+    has_required_nft, nft_count, collection_counts = result.has_nft, result.nft_count, result.collection_counts
     
-    return response
+    verification_time = time.time() - start_time
+    logger.info(f"📊 Verification result: has_nft={has_required_nft}, count={nft_count}, "
+                f"partial={result.partial}, from_cache={result.from_cache}, time={verification_time:.2f}s")
+    
+    # Send webhook to bot server
+    webhook_data = {
+        "tg_id": tg_id,
+        "has_nft": has_required_nft,
+        "username": f"user_{tg_id}",
+        "nft_count": nft_count,
+        "collection_counts": collection_counts,
+        "wallet_address": wallet_address,
+        "verification_time": round(verification_time, 2)
+    }
+    
+    logger.info(f"📦 Webhook data: {webhook_data}")
+    
+    webhook_sent = False
+    if result.partial:
+        # Don't tell the bot a holder lost their NFT just because we ran out of time
+        logger.warning(f"⏱️ Skipping webhook for user {tg_id}: partial result")
+    else:
+        # None means delivery is unknown; record() treats it as undelivered and the
+        # next sweep resends it, so the bot may see the same result twice
+        webhook_sent = send_webhook(webhook_data, deadline)
+        # Only known holdings are worth re-checking; a failed fetch tells us nothing
+        if reverification_scheduler is not None and not result.unavailable:
+            reverification_scheduler.record(tg_id, wallet_address, collection_ids, rule, min_count,
+                                            has_required_nft, nft_count, webhook_sent=webhook_sent)
+    
+    # Prepare response message
+    if len(collection_ids) > 1:
+        message = f"NFT verification completed (collections: {', '.join(collection_ids)}, rule: {rule})"
+    elif collection_ids:
+        message = f"NFT verification completed (collection: {collection_ids[0]})"
+    else:
+        message = "NFT verification completed (any NFT will pass)"
+    if result.partial:
+        message = "NFT verification incomplete: deadline exceeded before NFT data was fetched"
+    
+    return {
+        "has_nft": has_required_nft,
+        "nft_count": nft_count,
+        "wallet_address": wallet_address,
+        "collection_id": collection_ids[0] if len(collection_ids) == 1 else None,
+        "collection_ids": collection_ids,
+        "rule": rule,
+        "min_count": min_count,
+        "collection_counts": collection_counts,
+        "message": message,
+        "verification_time": round(time.time() - start_time, 2),
+        "partial": result.partial,
+        "from_cache": result.from_cache,
+        "unavailable": result.unavailable,
+        "webhook_sent": webhook_sent,
+        "status": "partial" if result.partial else "success"
+    }
+
+def run_admitted_verification(*args) -> dict:
+    """Run an async job's verification under the same global concurrency limit as sync requests"""
+    admission.acquire_slot(blocking=True)
+    try:
+        return run_verification(*args)
+    finally:
+        admission.release_slot()
 
 @app.route('/api/verify-nft', methods=['POST'])
 def verify_nft():
     """Verify NFT ownership for a wallet address"""
     start_time = time.time()
+    deadline = Deadline(MAX_VERIFICATION_TIME)
     
     try:
         data = request.get_json()
         wallet_address = data.get('wallet_address')
         tg_id = data.get('tg_id')
-        collection_id = data.get('collection_id')  # Add collection_id support
+        # Accept a single collection_id or a list via collection_ids / collection_id
+        raw_collection_ids = data.get('collection_ids') or data.get('collection_id')
+        rule = data.get('rule', 'any')
+        min_count = data.get('min_count', 1)
+        async_mode = data.get('async') is True or request.args.get('async') in ('1', 'true')
         
         if not wallet_address or not tg_id:
             return jsonify({"error": "Missing wallet_address or tg_id"}), 400
+        if not is_valid_collection_ids(raw_collection_ids):
+            return jsonify({"error": "collection_ids must be a string or a list of non-empty strings"}), 400
+        collection_ids = normalize_collection_ids(raw_collection_ids)
+        if rule not in COLLECTION_RULES:
+            return jsonify({"error": f"Invalid rule, expected one of: {', '.join(COLLECTION_RULES)}"}), 400
+        if not isinstance(min_count, int) or isinstance(min_count, bool) or min_count < 1:
+            return jsonify({"error": "min_count must be a positive integer"}), 400
+        
+        # Trusted callers still get the per-tg_id limit, just not the per-IP one
+        retry_after = admission.check_rate(tg_id, None if is_trusted_caller() else get_client_ip())
+        if retry_after is not None:
+            logger.warning(f"🚦 Rate limit hit for user {tg_id}, retry after {retry_after:.1f}s")
+            return too_many_requests("Too many verification requests", retry_after)
         
         logger.info(f"🔍 Verifying NFT ownership for wallet: {wallet_address}")
         logger.info(f"👤 Telegram ID: {tg_id}")
-        if collection_id:
-            logger.info(f"🎯 Collection ID: {collection_id}")
+        if collection_ids:
+            logger.info(f"🎯 Collection IDs: {collection_ids} (rule={rule}, min_count={min_count})")
         else:
             logger.info(f"🔑 No collection filter (any NFT will pass)")
         
-        # Check if verification is taking too long
-        if time.time() - start_time > MAX_VERIFICATION_TIME:
-            logger.warning(f"⚠️ Verification taking too long, aborting")
-            return jsonify({"error": "Verification timeout", "has_nft": False}), 408
-        
-        # Verify NFT ownership with collection filter
-        has_required_nft, nft_count = has_nft(wallet_address, collection_id)
-        
-        verification_time = time.time() - start_time
-        logger.info(f"📊 Verification result: has_nft={has_required_nft}, count={nft_count}, time={verification_time:.2f}s")
-        
-        # Send webhook to bot server (non-blocking)
-        webhook_data = {
-            "tg_id": tg_id,
-            "has_nft": has_required_nft,
-            "username": f"user_{tg_id}",
-            "nft_count": nft_count,
-            "wallet_address": wallet_address,
-            "verification_time": round(verification_time, 2)
-        }
-        
-        logger.info(f"📦 Webhook data: {webhook_data}")
+        if async_mode:
+            # Return a job id immediately; identical in-flight requests share one job
+            job_key = (str(tg_id), wallet_address, tuple(collection_ids), rule, min_count)
+            job, created = verification_jobs.submit(job_key, run_admitted_verification,
+                                                    wallet_address, tg_id, collection_ids, rule, min_count)
+            if job is None:
+                logger.warning(f"⚠️ Verification queue full, rejecting job for wallet: {wallet_address}")
+                admission.reject("job_queue_full")
+                return too_many_requests("Verification queue full, try again later", JOB_QUEUE_RETRY_AFTER)
+            logger.info(f"🧾 Verification job {job.id} {'queued' if created else 'deduplicated'}")
+            response = jsonify({
+                "job_id": job.id,
+                "status": job.status,
+                "deduplicated": not created,
+                "status_url": f"/api/verify-nft/jobs/{job.id}",
+                "events_url": f"/api/verify-nft/jobs/{job.id}/events"
+            })
+            return response, 202
         
-        # Send webhook asynchronously to prevent blocking
+        if not admission.acquire_slot():
+            logger.warning(f"🚦 Server busy, rejecting verification for wallet: {wallet_address}")
+            return too_many_requests("Server busy, try again shortly", 1)
         try:
-            webhook_response = requests.post(WEBHOOK_URL, json=webhook_data, timeout=WEBHOOK_TIMEOUT)
-            if webhook_response.status_code == 200:
-                logger.info(f"✅ Webhook sent successfully for user {tg_id}")
-            else:
-                logger.warning(f"❌ Webhook failed for user {tg_id}: {webhook_response.status_code}")
-                logger.warning(f"📄 Webhook response: {webhook_response.text}")
-        except Exception as e:
-            logger.error(f"❌ Error sending webhook: {e}")
-            # Don't fail the verification if webhook fails
-        
-        # Prepare response message
-        if collection_id:
-            message = f"NFT verification completed (collection: {collection_id})"
-        else:
-            message = "NFT verification completed (any NFT will pass)"
-        
-        response = jsonify({
-            "has_nft": has_required_nft,
-            "nft_count": nft_count,
-            "wallet_address": wallet_address,
-            "collection_id": collection_id,
-            "message": message,
-            "verification_time": round(verification_time, 2),
-            "status": "success"
-        })
-        
-        # Add CORS headers for all origins
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Requested-With')
-        response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
-        response.headers.add('Access-Control-Allow-Credentials', 'true')
-        response.headers.add('Access-Control-Max-Age', '3600')
+            response = jsonify(run_verification(wallet_address, tg_id, collection_ids, rule, min_count, deadline))
+        finally:
+            admission.release_slot()
         
         return response
         
@@ -149,15 +358,42 @@ def verify_nft():
             "verification_time": round(error_time, 2)
         })
         
-        # Add CORS headers for all origins
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Requested-With')
-        response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
-        response.headers.add('Access-Control-Allow-Credentials', 'true')
-        response.headers.add('Access-Control-Max-Age', '3600')
-        
         return response, 500
 
+@app.route('/api/verify-nft/jobs/<job_id>')
+def get_verification_job(job_id):
+    """Poll a verification job; pass ?wait=<seconds> to long-poll until it finishes"""
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0), JOB_MAX_WAIT)
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+    
+    job = verification_jobs.wait(job_id, wait)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job id"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/verify-nft/jobs/<job_id>/events')
+def stream_verification_job(job_id):
+    """Stream a verification job's status and result as server-sent events"""
+    job = verification_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job id"}), 404
+    
+    def events():
+        yield f"event: status\ndata: {json.dumps({'job_id': job.id, 'status': job.status})}\n\n"
+        deadline = time.time() + JOB_SSE_TIMEOUT
+        while not job.done.wait(SSE_KEEPALIVE_INTERVAL):
+            if time.time() >= deadline:
+                yield f"event: timeout\ndata: {json.dumps({'job_id': job.id, 'status': job.status})}\n\n"
+                return
+            # Comment line keeps proxies from closing the idle connection
+            yield ": keepalive\n\n"
+        yield f"event: result\ndata: {json.dumps(job.to_dict())}\n\n"
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/addresses/<wallet_address>/nft-assets')
 def get_nft_assets(wallet_address):
     """Get NFT assets for a wallet address"""
@@ -171,61 +407,42 @@ def get_nft_assets(wallet_address):
         response = requests.get(url, timeout=15)
         
         if response.status_code == 200:
-            nfts = response.json()
-            result = jsonify(nfts)
-            
-            # Add CORS headers
-            result.headers.add('Access-Control-Allow-Origin', '*')
-            result.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Requested-With')
-            result.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
-            result.headers.add('Access-Control-Allow-Credentials', 'true')
-            result.headers.add('Access-Control-Max-Age', '3600')
-            
-            return result
+            return jsonify(response.json())
         else:
             return jsonify({"error": "Failed to fetch NFTs"}), response.status_code
             
     except Exception as e:
         logger.error(f"❌ Error getting NFT assets: {e}")
-        response = jsonify({"error": str(e)})
-        
-        # Add CORS headers
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Requested-With')
-        response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
-        response.headers.add('Access-Control-Allow-Credentials', 'true')
-        response.headers.add('Access-Control-Max-Age', '3600')
-        
-        return response, 500
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/admission')
+def admission_stats():
+    """Admission control counters, including rejections by reason"""
+    return jsonify(admission.stats())
 
 @app.route('/api/health')
 def health_check():
     """Health check endpoint"""
-    return jsonify({
-        "status": "healthy",
-        "timestamp": time.time(),
-        "version": "2.0.0"
-    })
+    return app.response_class(f"{HEALTH_PAYLOAD_PREFIX}{time.time()}}}", mimetype='application/json')
 
 @app.route('/')
 def index():
     return send_from_directory('.', 'index.html')
 
-# Add OPTIONS handler for preflight requests
-@app.route('/api/config', methods=['OPTIONS'])
-@app.route('/api/verify-nft', methods=['OPTIONS'])
-@app.route('/api/addresses/<path:wallet_address>/nft-assets', methods=['OPTIONS'])
-@app.route('/api/health', methods=['OPTIONS'])
-def handle_options(wallet_address=None):
-    response = jsonify({})
-    response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Requested-With')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
-    response.headers.add('Access-Control-Allow-Credentials', 'true')
-    response.headers.add('Access-Control-Max-Age', '3600')
-    return response
+def start_reverification():
+    """Start the re-verification scheduler once per serving process and save its store on exit"""
+    # The debug reloader also runs this module in a watcher process; only sweep from the server
+    if reverification_scheduler is not None and (not app.debug or os.getenv("WERKZEUG_RUN_MAIN") == "true"):
+        reverification_scheduler.start()
+        atexit.register(reverification_scheduler.stop)
+
+if __name__ != '__main__':
+    # Imported by a WSGI server: there is no reloader, so start right away
+    start_reverification()
 
 if __name__ == '__main__':
     logger.info("🚀 Starting API Server with Python-based NFT verification...")
     logger.info("📊 Performance optimizations enabled: caching, timeouts, error handling")
-    app.run(host='0.0.0.0', port=5001, debug=True) 
+    app.debug = True
+    start_reverification()
+    app.run(host='0.0.0.0', port=5001, debug=app.debug) 
@@ -0,0 +1,68 @@
+import threading
+import time
+from typing import Any, Callable, Optional
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request has used up its time budget"""
+
+
+class Deadline:
+    """
+    A single time budget shared by every step of one verification.
+    Each step asks for its timeout and only gets the time that is left.
+    """
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline (never negative)"""
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """
+        Timeout to use for the next step: the remaining budget, capped at cap.
+        Raises DeadlineExceeded if no time is left.
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Deadline of {self.budget}s exceeded")
+        return min(remaining, cap) if cap is not None else remaining
+
+    def call(self, fn: Callable[..., Any], *args, cancel: Optional[Callable[[], None]] = None, **kwargs) -> Any:
+        """
+        Run fn(*args, **kwargs) and wait for it no longer than the remaining budget.
+        Per-phase socket timeouts alone let a slow, trickling response run past the
+        deadline; this bounds the caller's wall-clock wait. fn's own exceptions propagate.
+        Each call gets its own thread, so calls abandoned at a deadline can never
+        starve later ones. On timeout cancel() is invoked to stop the in-flight work.
+        Raises DeadlineExceeded if the budget runs out first.
+        """
+        timeout = self.timeout()
+        outcome = {}
+        finished = threading.Event()
+
+        def run():
+            try:
+                outcome["value"] = fn(*args, **kwargs)
+            except BaseException as e:
+                outcome["error"] = e
+            finally:
+                finished.set()
+
+        threading.Thread(target=run, name="deadline-call", daemon=True).start()
+        if not finished.wait(timeout):
+            if cancel is not None:
+                try:
+                    cancel()
+                except Exception:
+                    pass
+            raise DeadlineExceeded(f"Deadline of {self.budget}s exceeded")
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["value"]
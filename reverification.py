@@ -0,0 +1,269 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from deadline import Deadline
+
+logger = logging.getLogger(__name__)
+
+
+class ReverificationScheduler:
+    """
+    Periodically re-verify known (tg_id, wallet, collection) tuples.
+    Entries are persisted to a JSON file, swept soonest-due first within a rate
+    budget, and the webhook is only called when has_nft or nft_count changed.
+    Since next_due is last_checked + interval, soonest-due is also least recently checked.
+
+    Each member (tg_id plus collection rule) tracks only its latest verified wallet,
+    and only holders are tracked: once a member is known not to hold, the entry is
+    dropped. Entries not confirmed by a live verification within entry_ttl expire,
+    and at most max_entries are kept (the least recently verified are evicted).
+    """
+
+    def __init__(self, store_path: str, verify_fn: Callable, webhook_fn: Callable[[Dict[str, Any], Deadline], Optional[bool]],
+                 interval: float = 21600, sweep_interval: float = 60, max_per_sweep: int = 50,
+                 rate_per_second: float = 1.0, verification_budget: float = 25,
+                 max_entries: int = 10000, entry_ttl: float = 30 * 86400):
+        self.store_path = store_path
+        self.verify_fn = verify_fn
+        self.webhook_fn = webhook_fn
+        self.interval = interval
+        self.sweep_interval = sweep_interval
+        self.max_per_sweep = max_per_sweep
+        self.rate_per_second = rate_per_second
+        self.verification_budget = verification_budget
+        self.max_entries = max_entries
+        self.entry_ttl = entry_ttl
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self._load()
+
+    @staticmethod
+    def entry_key(tg_id, collection_ids: List[str], rule: str, min_count: int) -> str:
+        """One entry per member and rule; verifying a new wallet replaces the old one"""
+        return f"{tg_id}|{','.join(collection_ids)}|{rule}|{min_count}"
+
+    def record(self, tg_id, wallet_address: str, collection_ids: List[str], rule: str, min_count: int,
+               has_nft: bool, nft_count: int, webhook_sent: Optional[bool] = True):
+        """
+        Remember the latest result of a verification so it can be re-checked later.
+        Stored state is what the bot was told: if the webhook was not (or not surely) delivered the
+        previous state is kept and the entry is made due, so the next sweep delivers it.
+        """
+        now = time.time()
+        key = self.entry_key(tg_id, collection_ids, rule, min_count)
+        with self.lock:
+            if not webhook_sent:
+                entry = self.entries.get(key)
+                if entry is None:
+                    if not has_nft:
+                        return
+                    # The bot has never been told this member holds
+                    entry = self.entries[key] = {
+                        "tg_id": tg_id,
+                        "collection_ids": list(collection_ids),
+                        "rule": rule,
+                        "min_count": min_count,
+                        "has_nft": False,
+                        "nft_count": 0,
+                    }
+                entry.update({
+                    "wallet_address": wallet_address,
+                    "recorded_at": now,
+                    "last_checked": now,
+                    "next_due": now,
+                })
+                self._enforce_limit()
+                self.dirty = True
+                return
+            if not has_nft:
+                # Nothing to catch for a non-holder; this also keeps made-up tg_id/wallet pairs out
+                if self.entries.pop(key, None) is not None:
+                    self.dirty = True
+                return
+            self.entries[key] = {
+                "tg_id": tg_id,
+                "wallet_address": wallet_address,
+                "collection_ids": list(collection_ids),
+                "rule": rule,
+                "min_count": min_count,
+                "has_nft": has_nft,
+                "nft_count": nft_count,
+                "recorded_at": now,
+                "last_checked": now,
+                "next_due": now + self.interval,
+            }
+            self._enforce_limit()
+            # Persisted by the scheduler thread, not on the request path
+            self.dirty = True
+
+    def due_entries(self, now: float = None) -> List[Dict[str, Any]]:
+        """Snapshots of entries due for re-verification, soonest due first"""
+        now = time.time() if now is None else now
+        with self.lock:
+            self._expire(now)
+            due = [dict(entry) for entry in self.entries.values() if entry["next_due"] <= now]
+        due.sort(key=lambda entry: entry["next_due"])
+        return due[:self.max_per_sweep]
+
+    def sweep(self) -> int:
+        """Re-verify due entries within the rate budget; returns the number of webhooks sent"""
+        due = self.due_entries()
+        if not due:
+            return 0
+
+        logger.info(f"🔁 Re-verifying {len(due)} wallets")
+        changed = 0
+        min_gap = 1.0 / self.rate_per_second if self.rate_per_second > 0 else 0
+        for entry in due:
+            if self.stop_event.is_set():
+                break
+            started = time.monotonic()
+            try:
+                if self._reverify(entry):
+                    changed += 1
+            except Exception as e:
+                logger.error(f"❌ Error re-verifying wallet {entry['wallet_address']}: {e}")
+            # Pace upstream calls to stay within the rate budget
+            self.stop_event.wait(max(min_gap - (time.monotonic() - started), 0))
+
+        self._save()
+        logger.info(f"🔁 Re-verification sweep done: {changed} changed of {len(due)}")
+        return changed
+
+    def _reverify(self, snapshot: Dict[str, Any]) -> bool:
+        deadline = Deadline(self.verification_budget)
+        result = self.verify_fn(snapshot["wallet_address"], snapshot["collection_ids"], snapshot["rule"],
+                                snapshot["min_count"], deadline)
+        key = self.entry_key(snapshot["tg_id"], snapshot["collection_ids"], snapshot["rule"], snapshot["min_count"])
+
+        if result.partial or result.unavailable:
+            # Keep the stored state and try again next sweep; a timeout or Helius
+            # outage must never look like the holder selling their NFT
+            logger.warning(f"⚠️ Could not re-verify wallet {snapshot['wallet_address']}, keeping previous state")
+            return False
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry["last_checked"] > snapshot["last_checked"]:
+                # A live verification recorded a newer result (and sent its webhook) mid-sweep
+                return False
+            previous_has_nft, previous_nft_count = entry["has_nft"], entry["nft_count"]
+
+        changed = result.has_nft != previous_has_nft or result.nft_count != previous_nft_count
+        webhook_sent = False
+        if changed:
+            logger.info(f"🔔 Holding changed for user {snapshot['tg_id']}: "
+                        f"has_nft {previous_has_nft} -> {result.has_nft}, "
+                        f"nft_count {previous_nft_count} -> {result.nft_count}")
+            webhook_data = {
+                "tg_id": snapshot["tg_id"],
+                "has_nft": result.has_nft,
+                "username": f"user_{snapshot['tg_id']}",
+                "nft_count": result.nft_count,
+                "collection_counts": result.collection_counts,
+                "wallet_address": snapshot["wallet_address"],
+                "reverification": True
+            }
+            webhook_sent = self.webhook_fn(webhook_data, deadline)
+
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry["last_checked"] > snapshot["last_checked"]:
+                return webhook_sent
+            if changed and not webhook_sent:
+                # Keep the old state (and due time) so the change is reported again next sweep
+                entry["last_checked"] = now
+            elif not result.has_nft:
+                # The bot now knows this member no longer holds; stop tracking them
+                del self.entries[key]
+            else:
+                entry.update({
+                    "has_nft": result.has_nft,
+                    "nft_count": result.nft_count,
+                    "last_checked": now,
+                    "next_due": now + self.interval,
+                })
+            self.dirty = True
+        return webhook_sent
+
+    def start(self):
+        """Start sweeping in a background thread"""
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._run, name="reverification", daemon=True)
+        self.thread.start()
+        logger.info(f"🔁 Re-verification scheduler started ({len(self.entries)} known wallets)")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self._save()
+
+    def _run(self):
+        while not self.stop_event.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"❌ Error in re-verification sweep: {e}")
+            # Persist entries recorded since the last save even if nothing was due
+            self._save()
+
+    def _expire(self, now: float):
+        """Drop entries no live verification has confirmed within entry_ttl (caller holds the lock)"""
+        expired = [key for key, entry in self.entries.items()
+                   if now - entry.get("recorded_at", entry["last_checked"]) > self.entry_ttl]
+        for key in expired:
+            del self.entries[key]
+        if expired:
+            logger.info(f"🔁 Expired {len(expired)} re-verification entries")
+            self.dirty = True
+
+    def _enforce_limit(self):
+        """Evict the least recently verified entries past max_entries (caller holds the lock)"""
+        while len(self.entries) > self.max_entries:
+            oldest = min(self.entries, key=lambda key: self.entries[key].get("recorded_at", 0))
+            del self.entries[oldest]
+            logger.warning(f"⚠️ Re-verification store full, evicted entry {oldest}")
+
+    def _load(self):
+        try:
+            with open(self.store_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            # Re-key through entry_key so older stores collapse to one wallet per member
+            self.entries = {}
+            for entry in sorted(stored.values(), key=lambda entry: entry["last_checked"]):
+                key = self.entry_key(entry["tg_id"], entry["collection_ids"], entry["rule"], entry["min_count"])
+                self.entries[key] = entry
+            self._enforce_limit()
+        except FileNotFoundError:
+            self.entries = {}
+        except (OSError, ValueError) as e:
+            logger.error(f"❌ Could not load re-verification store {self.store_path}: {e}")
+            self.entries = {}
+
+    def _save(self):
+        """Write the store atomically (if it changed) so a crash never leaves a truncated file"""
+        with self.lock:
+            if not self.dirty:
+                return
+            data = json.dumps(self.entries)
+            self.dirty = False
+        tmp_path = f"{self.store_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.store_path)
+        except OSError as e:
+            with self.lock:
+                self.dirty = True
+            logger.error(f"❌ Could not save re-verification store {self.store_path}: {e}")
@@ -0,0 +1,107 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_ERROR = "error"
+
+
+class VerificationJob:
+    """A single asynchronous verification and its result"""
+
+    def __init__(self, key: Hashable):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = JOB_QUEUED
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.done = threading.Event()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the job for API responses"""
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+        if self.result is not None:
+            data["result"] = self.result
+        if self.error is not None:
+            data["error"] = self.error
+        return data
+
+
+class VerificationJobs:
+    """
+    Run verifications on a bounded worker pool and keep their results for polling.
+    Jobs with the same key are deduplicated while one is still queued or running.
+    """
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 100, job_ttl: int = 300):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="verify-job")
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        self.jobs: Dict[str, VerificationJob] = {}
+        self.active: Dict[Hashable, str] = {}
+        self.lock = threading.Lock()
+
+    def submit(self, key: Hashable, fn: Callable[..., Dict[str, Any]], *args) -> Tuple[Optional[VerificationJob], bool]:
+        """
+        Queue fn(*args) unless a job with the same key is already in flight.
+        Returns: (job, created) - job is None when the pending queue is full.
+        """
+        with self.lock:
+            self._purge_expired()
+            active_id = self.active.get(key)
+            if active_id is not None:
+                return self.jobs[active_id], False
+            if len(self.active) >= self.max_pending:
+                return None, False
+            job = VerificationJob(key)
+            self.jobs[job.id] = job
+            self.active[key] = job.id
+        self.executor.submit(self._run, job, fn, args)
+        return job, True
+
+    def get(self, job_id: str) -> Optional[VerificationJob]:
+        """Return a job by id, or None if unknown or expired"""
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def wait(self, job_id: str, timeout: float) -> Optional[VerificationJob]:
+        """Block until the job finishes or timeout elapses (long-poll)"""
+        job = self.get(job_id)
+        if job is not None and timeout > 0:
+            job.done.wait(timeout)
+        return job
+
+    def _run(self, job: VerificationJob, fn: Callable[..., Dict[str, Any]], args: tuple):
+        job.status = JOB_RUNNING
+        try:
+            job.result = fn(*args)
+            job.status = JOB_DONE
+        except Exception as e:
+            job.error = str(e)
+            job.status = JOB_ERROR
+        finally:
+            job.finished_at = time.time()
+            with self.lock:
+                if self.active.get(job.key) == job.id:
+                    del self.active[job.key]
+            job.done.set()
+
+    def _purge_expired(self):
+        """Drop finished jobs older than job_ttl (caller holds the lock)"""
+        cutoff = time.time() - self.job_ttl
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
@@ -1,9 +1,12 @@
 import requests
 import os
-from typing import Tuple, Optional, List, Dict
+import json
+import socket
+from typing import Any, Tuple, Optional, List, Dict, NamedTuple, Union
 from dotenv import load_dotenv
 import time
 from functools import lru_cache
+from deadline import Deadline, DeadlineExceeded
 
 load_dotenv()
 
@@ -14,10 +17,23 @@ DAS_API_URL = "https://mainnet.helius-rpc.com"  # DAS API endpoint
 LAMPORTS_PER_SOL = 1_000_000_000  # Conversion factor for SOL (1 SOL = 1e9 lamports)
 
 # Performance settings
-REQUEST_TIMEOUT = 15  # 15 seconds timeout for API calls
+REQUEST_TIMEOUT = 15  # Per-call cap; each call also gets no more than the request's remaining deadline
+RESPONSE_CHUNK_SIZE = 64 * 1024  # Bodies are streamed in chunks so a slow download stops at the deadline
 CACHE_DURATION = 300  # 5 minutes cache duration
 MAX_ITEMS_TO_PROCESS = 100  # Limit items to process to prevent timeouts
 
+# Rules for combining multiple collections
+COLLECTION_RULES = ("any", "all", "total")
+
+class CollectionCheck(NamedTuple):
+    """Result of checking a wallet against one or more collections"""
+    has_nft: bool
+    nft_count: int
+    collection_counts: Dict[str, int]
+    partial: bool = False  # Deadline ran out before NFT data could be fetched
+    from_cache: bool = False  # Answer was served from cached NFT data
+    unavailable: bool = False  # NFT data could not be fetched (upstream error), so has_nft is unknown
+
 # Simple in-memory cache with expiration
 wallet_cache = {}
 cache_timestamps = {}
@@ -32,16 +48,66 @@ def is_cache_valid(cache_key: str) -> bool:
         return False
     return time.time() - cache_timestamps[cache_key] < CACHE_DURATION
 
+def request_timeout(deadline: Optional[Deadline]) -> float:
+    """Timeout for one upstream call: REQUEST_TIMEOUT capped by the remaining deadline"""
+    return deadline.timeout(REQUEST_TIMEOUT) if deadline else REQUEST_TIMEOUT
+
+def abort_response(response: requests.Response):
+    """Close a streaming response from another thread, unblocking a read in progress"""
+    try:
+        # Shutting the socket down (through a dup of its fd) wakes the blocked reader;
+        # response.close() alone would wait for that read to finish
+        with socket.fromfd(response.raw.fileno(), socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.shutdown(socket.SHUT_RDWR)
+    except (OSError, ValueError):
+        pass
+    response.close()
+
+def fetch_json(method: str, url: str, deadline: Optional[Deadline] = None, **kwargs) -> Any:
+    """
+    Make one upstream call and return its parsed JSON body.
+    With a deadline, the caller never waits longer than the remaining budget, and on
+    expiry the in-flight download is aborted (its socket is shut down). A call still
+    waiting for response headers ends at its socket timeout, itself capped by the budget.
+    Raises:
+        requests.RequestException / ValueError: on HTTP, network or JSON errors.
+        DeadlineExceeded: if the deadline runs out first.
+    """
+    session = requests.Session()
+    in_flight = {}
+    
+    def fetch():
+        with session.request(method, url, timeout=request_timeout(deadline), stream=True, **kwargs) as response:
+            in_flight["response"] = response
+            response.raise_for_status()
+            body = bytearray()
+            for chunk in response.iter_content(chunk_size=RESPONSE_CHUNK_SIZE):
+                if deadline and deadline.expired():
+                    raise DeadlineExceeded(f"Deadline exceeded while reading {method} response")
+                body.extend(chunk)
+            return json.loads(body)
+    
+    def cancel():
+        response = in_flight.get("response")
+        if response is not None:
+            abort_response(response)
+    
+    try:
+        return deadline.call(fetch, cancel=cancel) if deadline else fetch()
+    finally:
+        session.close()
+
 def set_cache(cache_key: str, data: any):
     """Set cache data with timestamp"""
     wallet_cache[cache_key] = data
     cache_timestamps[cache_key] = time.time()
 
-def get_wallet_balance(wallet_address: str) -> Optional[float]:
+def get_wallet_balance(wallet_address: str, deadline: Optional[Deadline] = None) -> Optional[float]:
     """
     Fetch the SOL balance of a wallet using Helius API.
     Args:
         wallet_address: The Solana wallet address.
+        deadline: Time budget shared with the rest of the request (optional).
     Returns:
         SOL balance as a float, or None if the request fails.
     """
@@ -53,9 +119,7 @@ def get_wallet_balance(wallet_address: str) -> Optional[float]:
     
     url = f"{HELIUS_API_URL}/addresses/{wallet_address}/balances?api-key={HELIUS_API_KEY}"
     try:
-        response = requests.get(url, timeout=REQUEST_TIMEOUT)
-        response.raise_for_status()
-        data = response.json()
+        data = fetch_json("GET", url, deadline)
         balance = data.get("nativeBalance", 0) / LAMPORTS_PER_SOL
         
         # Cache the result
@@ -65,11 +129,13 @@ def get_wallet_balance(wallet_address: str) -> Optional[float]:
         set_cache(cache_key, wallet_cache[cache_key])
         
         return balance
-    except requests.RequestException as e:
+    except (requests.RequestException, ValueError) as e:
+        if deadline and deadline.expired():
+            raise DeadlineExceeded(f"Deadline exceeded while fetching wallet balance: {e}")
         print(f"Error fetching wallet balance: {e}")
         return None
 
-def get_wallet_nfts_alternative(wallet_address: str) -> Optional[List[Dict]]:
+def get_wallet_nfts_alternative(wallet_address: str, deadline: Optional[Deadline] = None) -> Optional[List[Dict]]:
     """
     Alternative method using Helius v0 API for NFT detection
     """
@@ -78,35 +144,75 @@ def get_wallet_nfts_alternative(wallet_address: str) -> Optional[List[Dict]]:
         
         print(f"🎨 Fetching NFTs using alternative method for: {wallet_address}")
         
-        response = requests.get(url, timeout=REQUEST_TIMEOUT)
-        print(f"📊 Alternative API Response Status: {response.status_code}")
-        
-        if response.status_code == 200:
-            nfts = response.json()
-            print(f"✅ Alternative method found {len(nfts)} NFTs")
-            return nfts
-        else:
-            print(f"❌ Alternative API failed: {response.status_code}")
-            return []
+        nfts = fetch_json("GET", url, deadline)
+        print(f"✅ Alternative method found {len(nfts)} NFTs")
+        return nfts
             
+    except DeadlineExceeded:
+        raise
     except Exception as e:
+        if deadline and deadline.expired():
+            raise DeadlineExceeded(f"Deadline exceeded while fetching NFTs: {e}")
         print(f"❌ Error in alternative NFT fetch: {e}")
         return []
 
-def get_wallet_nfts_by_collection(wallet_address: str, collection_id: str = None) -> Optional[List[Dict]]:
+def is_nft_item(item: Dict) -> bool:
+    """Check if a DAS asset looks like an NFT based on multiple criteria"""
+    # Criterion 1: Token standard
+    token_standard = item.get("content", {}).get("metadata", {}).get("token_standard", "")
+    if token_standard in ["NonFungible", "non-fungible", "NONFUNGIBLE"]:
+        return True
+    
+    # Criterion 2: Interface type
+    interface = item.get("interface", "")
+    if interface in ["V1_NFT", "MplCoreAsset"]:
+        return True
+    
+    # Criterion 3: Has files or name/symbol
+    content = item.get("content", {})
+    metadata = content.get("metadata", {})
+    if content.get("files", []) or metadata.get("name", "") or metadata.get("symbol", ""):
+        return True
+    
+    # Criterion 4: Check for NFT keywords in description
+    description = metadata.get("description", "")
+    return any(keyword in description.lower() for keyword in ["nft", "non-fungible", "token"])
+
+def get_nft_collection(nft: Dict) -> Optional[str]:
+    """Return the collection an NFT belongs to, if any"""
+    grouping = nft.get("grouping", [])
+    if grouping and len(grouping) > 0:
+        return grouping[0].get("group_value")
+    return None
+
+def get_cached_nfts(wallet_address: str, allow_stale: bool = False) -> Optional[List[Dict]]:
+    """Return cached NFTs for a wallet, optionally even if the cache has expired"""
+    cache_key = get_cache_key(wallet_address)
+    if 'nfts' not in wallet_cache.get(cache_key, {}):
+        return None
+    if not allow_stale and not is_cache_valid(cache_key):
+        return None
+    return wallet_cache[cache_key]['nfts']
+
+def get_wallet_nfts(wallet_address: str, deadline: Optional[Deadline] = None) -> Optional[List[Dict]]:
     """
-    Fetch NFTs owned by a wallet for a specific collection using Helius DAS API.
+    Fetch all NFTs owned by a wallet using Helius DAS API.
+    The unfiltered list is cached per wallet so any number of collection
+    checks can be answered from a single upstream download.
     Args:
         wallet_address: The Solana wallet address.
-        collection_id: The collection ID to filter by (optional).
+        deadline: Time budget shared with the rest of the request (optional).
     Returns:
         List of NFTs, or None if the request fails.
+    Raises:
+        DeadlineExceeded: if the deadline runs out before the data arrives.
     """
     # Check cache first
-    cache_key = get_cache_key(wallet_address, collection_id)
-    if is_cache_valid(cache_key) and 'nfts' in wallet_cache.get(cache_key, {}):
+    cache_key = get_cache_key(wallet_address)
+    cached_nfts = get_cached_nfts(wallet_address)
+    if cached_nfts is not None:
         print(f"🎨 Using cached NFTs for {wallet_address}")
-        return wallet_cache[cache_key]['nfts']
+        return cached_nfts
     
     # Using Helius DAS API for NFTs - optimized approach
     url = f"{DAS_API_URL}/?api-key={HELIUS_API_KEY}"
@@ -120,147 +226,195 @@ def get_wallet_nfts_by_collection(wallet_address: str, collection_id: str = None
     }
     
     print(f"🎨 Fetching fresh NFTs for wallet: {wallet_address}")
-    if collection_id:
-        print(f"🎯 Filtering by collection: {collection_id}")
     
     try:
-        response = requests.post(url, json=payload, timeout=REQUEST_TIMEOUT)
-        print(f"📊 Response Status: {response.status_code}")
+        data = fetch_json("POST", url, deadline, json=payload)
+    except (requests.RequestException, ValueError) as e:
+        # Any failure once the budget is gone is a timeout, not "no NFTs"
+        if deadline and deadline.expired():
+            raise DeadlineExceeded(f"Deadline exceeded while fetching NFTs: {e}")
+        print(f"❌ Error fetching NFTs: {e}")
+        return None
+    
+    # Check for error in response
+    if "error" in data:
+        print(f"❌ API Error: {data['error']}")
+        return None
+    
+    if "result" in data and "items" in data["result"]:
+        all_items = data["result"]["items"]
+        print(f"📦 Total items received: {len(all_items)}")
         
-        response.raise_for_status()
-        data = response.json()
+        # Limit items to process to prevent timeouts
+        if len(all_items) > MAX_ITEMS_TO_PROCESS:
+            print(f"⚠️ Limiting processing to first {MAX_ITEMS_TO_PROCESS} items to prevent timeout")
+            all_items = all_items[:MAX_ITEMS_TO_PROCESS]
         
-        # Check for error in response
-        if "error" in data:
-            print(f"❌ API Error: {data['error']}")
-            return None
+        # Log first few items for debugging
+        for i, item in enumerate(all_items[:3]):
+            token_standard = item.get("content", {}).get("metadata", {}).get("token_standard", "Unknown")
+            interface = item.get("interface", "Unknown")
+            collection = get_nft_collection(item) or "Unknown"
+            print(f"  Item {i+1}: token_standard = {token_standard}, interface = {interface}, collection = {collection}")
         
-        if "result" in data and "items" in data["result"]:
-            all_items = data["result"]["items"]
-            print(f"📦 Total items received: {len(all_items)}")
-            
-            # Limit items to process to prevent timeouts
-            if len(all_items) > MAX_ITEMS_TO_PROCESS:
-                print(f"⚠️ Limiting processing to first {MAX_ITEMS_TO_PROCESS} items to prevent timeout")
-                all_items = all_items[:MAX_ITEMS_TO_PROCESS]
-            
-            # Log first few items for debugging
-            for i, item in enumerate(all_items[:3]):
-                token_standard = item.get("content", {}).get("metadata", {}).get("token_standard", "Unknown")
-                interface = item.get("interface", "Unknown")
-                grouping = item.get("grouping", [])
-                collection = grouping[0].get("group_value", "Unknown") if grouping and len(grouping) > 0 else "Unknown"
-                print(f"  Item {i+1}: token_standard = {token_standard}, interface = {interface}, collection = {collection}")
-            
-            # Optimized NFT filtering - check multiple criteria efficiently
-            nfts = []
-            for item in all_items:
-                # Check if it's an NFT based on multiple criteria
-                is_nft = False
-                
-                # Criterion 1: Token standard
-                token_standard = item.get("content", {}).get("metadata", {}).get("token_standard", "")
-                if token_standard in ["NonFungible", "non-fungible", "NONFUNGIBLE"]:
-                    is_nft = True
-                
-                # Criterion 2: Interface type
-                interface = item.get("interface", "")
-                if interface in ["V1_NFT", "MplCoreAsset"]:
-                    is_nft = True
-                
-                # Criterion 3: Has files or name/symbol
-                content = item.get("content", {})
-                files = content.get("files", [])
-                metadata = content.get("metadata", {})
-                name = metadata.get("name", "")
-                symbol = metadata.get("symbol", "")
-                
-                if files or name or symbol:
-                    is_nft = True
-                
-                # Criterion 4: Check for NFT keywords in description (only if not already identified)
-                if not is_nft:
-                    description = metadata.get("description", "")
-                    if any(keyword in description.lower() for keyword in ["nft", "non-fungible", "token"]):
-                        is_nft = True
-                
-                if is_nft:
-                    nfts.append(item)
-            
-            # If collection_id is specified, filter by collection
-            if collection_id:
-                filtered_nfts = []
-                for nft in nfts:
-                    grouping = nft.get("grouping", [])
-                    if grouping and len(grouping) > 0:
-                        nft_collection = grouping[0].get("group_value")
-                        if nft_collection == collection_id:
-                            filtered_nfts.append(nft)
-                nfts = filtered_nfts
-                print(f"🎨 NFTs in collection {collection_id}: {len(nfts)}")
-            else:
-             print(f"🎨 Non-fungible tokens found: {len(nfts)}")
-            
-            # Cache the result
-            set_cache(cache_key, {'nfts': nfts})
-            
-            return nfts
-        else:
-            print(f"❌ No 'result' or 'items' in response")
-            return []
-    except requests.RequestException as e:
-        print(f"❌ Error fetching NFTs: {e}")
+        nfts = [item for item in all_items if is_nft_item(item)]
+        print(f"🎨 Non-fungible tokens found: {len(nfts)}")
+        
+        # Cache the result without clobbering a cached balance
+        cached = wallet_cache.get(cache_key, {})
+        cached['nfts'] = nfts
+        set_cache(cache_key, cached)
+        
+        return nfts
+    else:
+        # A malformed response says nothing about the wallet; treat it as a failed fetch
+        print(f"❌ No 'result' or 'items' in response")
         return None
 
-def has_nft_python(wallet_address: str, collection_id: str = None) -> Tuple[bool, int]:
+def get_wallet_nfts_by_collection(wallet_address: str, collection_id: str = None,
+                                  deadline: Optional[Deadline] = None) -> Optional[List[Dict]]:
     """
-    Check if wallet has NFTs using Python-based approach (replacing JavaScript)
+    Fetch NFTs owned by a wallet for a specific collection using Helius DAS API.
     Args:
         wallet_address: The Solana wallet address.
         collection_id: The collection ID to filter by (optional).
-    Returns: (has_nft, nft_count)
+        deadline: Time budget shared with the rest of the request (optional).
+    Returns:
+        List of NFTs, or None if the request fails.
+    """
+    nfts = get_wallet_nfts(wallet_address, deadline)
+    if nfts is None or not collection_id:
+        return nfts
+    
+    nfts = [nft for nft in nfts if get_nft_collection(nft) == collection_id]
+    print(f"🎨 NFTs in collection {collection_id}: {len(nfts)}")
+    return nfts
+
+def normalize_collection_ids(collection_id: Union[str, List[str], None]) -> List[str]:
+    """Turn a single collection id, a list of ids or None into a de-duplicated list"""
+    if not collection_id:
+        return []
+    if isinstance(collection_id, str):
+        return [collection_id]
+    return list(dict.fromkeys(c for c in collection_id if c))
+
+def count_nfts_by_collection(nfts: List[Dict], collection_ids: List[str]) -> Dict[str, int]:
+    """Count NFTs per requested collection in a single pass over the wallet's assets"""
+    counts = {collection_id: 0 for collection_id in collection_ids}
+    for nft in nfts:
+        nft_collection = get_nft_collection(nft)
+        if nft_collection in counts:
+            counts[nft_collection] += 1
+    return counts
+
+def evaluate_collection_rule(counts: Dict[str, int], rule: str = "any", min_count: int = 1) -> bool:
+    """
+    Evaluate a holding rule against per-collection counts.
+    Rules:
+        any:   at least min_count NFTs in at least one collection
+        all:   at least min_count NFTs in every collection
+        total: at least min_count NFTs summed across all collections
     """
+    if rule not in COLLECTION_RULES:
+        raise ValueError(f"Unknown rule '{rule}', expected one of: {', '.join(COLLECTION_RULES)}")
+    if not counts:
+        return False
+    if rule == "any":
+        return any(count >= min_count for count in counts.values())
+    if rule == "all":
+        return all(count >= min_count for count in counts.values())
+    return sum(counts.values()) >= min_count
+
+def check_collections(wallet_address: str, collection_id: Union[str, List[str], None] = None,
+                      rule: str = "any", min_count: int = 1,
+                      deadline: Optional[Deadline] = None) -> CollectionCheck:
+    """
+    Check one or more collections against a holding rule from a single fetch.
+    If the deadline runs out before fresh data arrives, expired cached data is used
+    when available; otherwise a failed, partial result is returned. If the upstream
+    fetch fails, the result is marked unavailable rather than reporting no NFTs.
+    Args:
+        wallet_address: The Solana wallet address.
+        collection_id: A collection ID, a list of collection IDs, or None for any NFT.
+        rule: One of "any", "all" or "total".
+        min_count: Minimum number of NFTs the rule requires.
+        deadline: Time budget for the whole check (optional).
+    Returns: CollectionCheck(has_nft, nft_count, collection_counts, partial, from_cache, unavailable)
+    """
+    if rule not in COLLECTION_RULES:
+        raise ValueError(f"Unknown rule '{rule}', expected one of: {', '.join(COLLECTION_RULES)}")
+    if min_count < 1:
+        raise ValueError("min_count must be at least 1")
+    
+    collection_ids = normalize_collection_ids(collection_id)
     try:
         print(f"🔍 Checking NFT ownership for wallet: {wallet_address}")
-        if collection_id:
-            print(f"🎯 Checking for collection: {collection_id}")
+        if collection_ids:
+            print(f"🎯 Checking collections {collection_ids} (rule={rule}, min_count={min_count})")
         else:
             print(f"🔑 Checking for any NFT (no collection filter)")
         
-        # Get NFTs from wallet (with collection filter if specified)
-        nfts = get_wallet_nfts_by_collection(wallet_address, collection_id)
+        nfts = get_cached_nfts(wallet_address)
+        from_cache = nfts is not None
+        if nfts is None:
+            try:
+                nfts = get_wallet_nfts(wallet_address, deadline)
+            except DeadlineExceeded as e:
+                print(f"⏱️ {e}")
+                nfts = get_cached_nfts(wallet_address, allow_stale=True)
+                if nfts is None:
+                    print(f"❌ No cached NFT data to fall back on - returning partial result")
+                    return CollectionCheck(False, 0, {}, partial=True)
+                print(f"🎨 Falling back to expired cached NFTs for {wallet_address}")
+                from_cache = True
         
         if nfts is None:
             print(f"❌ Failed to fetch NFT data")
-            return False, 0
+            return CollectionCheck(False, 0, {}, unavailable=True)
         
-        nft_count = len(nfts)
-        print(f"📊 Total NFTs found: {nft_count}")
+        if not collection_ids:
+            nft_count = len(nfts)
+            print(f"📊 Total NFTs found: {nft_count}")
+            return CollectionCheck(nft_count >= min_count, nft_count, {}, from_cache=from_cache)
         
-        # Check if wallet has any NFTs
-        if nft_count > 0:
-            if collection_id:
-                print(f"✅ Wallet has {nft_count} NFTs in collection {collection_id} - verification successful")
-            else:
-             print(f"✅ Wallet has {nft_count} NFTs - verification successful")
-            return True, nft_count
+        counts = count_nfts_by_collection(nfts, collection_ids)
+        nft_count = sum(counts.values())
+        passed = evaluate_collection_rule(counts, rule, min_count)
+        print(f"📊 NFTs per collection: {counts}")
+        if passed:
+            print(f"✅ Wallet satisfies rule '{rule}' with {nft_count} NFTs - verification successful")
         else:
-            if collection_id:
-                print(f"❌ Wallet has no NFTs in collection {collection_id} - verification failed")
-            else:
-             print(f"❌ Wallet has no NFTs - verification failed")
-            return False, 0
+            print(f"❌ Wallet does not satisfy rule '{rule}' - verification failed")
+        return CollectionCheck(passed, nft_count, counts, from_cache=from_cache)
             
     except Exception as e:
         print(f"❌ Error in Python NFT verification: {e}")
+        return CollectionCheck(False, 0, {}, unavailable=True)
+
+def has_nft_python(wallet_address: str, collection_id: str = None) -> Tuple[bool, int]:
+    """
+    Check if wallet has NFTs using Python-based approach (replacing JavaScript)
+    Args:
+        wallet_address: The Solana wallet address.
+        collection_id: The collection ID to filter by (optional).
+    Returns: (has_nft, nft_count)
+    """
+    result = check_collections(wallet_address, collection_id)
+    if not result.has_nft:
         return False, 0
+    return True, result.nft_count
 
-def has_nft(wallet_address: str, collection_id: str = None) -> Tuple[bool, int]:
+def has_nft(wallet_address: str, collection_id: Union[str, List[str], None] = None,
+            rule: str = "any", min_count: int = 1, deadline: Optional[Deadline] = None) -> Tuple[bool, int]:
     """
     Main function - use Python approach instead of JavaScript
     Args:
         wallet_address: The Solana wallet address.
-        collection_id: The collection ID to filter by (optional).
+        collection_id: A collection ID or list of collection IDs to filter by (optional).
+        rule: How to combine multiple collections: "any", "all" or "total".
+        min_count: Minimum number of NFTs the rule requires.
+        deadline: Time budget for the whole check (optional).
     Returns: (has_nft, nft_count)
     """
-    return has_nft_python(wallet_address, collection_id) 
+    result = check_collections(wallet_address, collection_id, rule, min_count, deadline)
+    return result.has_nft, result.nft_count